@@ -0,0 +1,204 @@
+import os
+import time
+import pickle
+import datetime
+import akshare as ak
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+# 配置参数
+MAX_WORKERS = 8       # 并发下载历史数据的线程数
+CACHE_DIR = '_cache'  # 历史行情磁盘缓存目录
+
+# akshare中文列名到统一英文列名的映射
+COLUMN_MAP = {
+    '日期': 'date',
+    '开盘': 'open',
+    '最高': 'high',
+    '最低': 'low',
+    '收盘': 'close',
+    '成交量': 'volume'
+}
+# 价格用float32足够表示（行情只有3位小数，需要时可按最小变动单位还原，见etf_trend_signals.tick_price）；
+# 成交量累加后数值很大（OBV），保留float64
+OHLCV_DTYPES = {
+    'open': 'float32',
+    'high': 'float32',
+    'low': 'float32',
+    'close': 'float32',
+    'volume': 'float64'
+}
+# 实时行情表中文列名到统一英文列名的映射
+SPOT_COLUMN_MAP = {
+    '开盘价': 'open',
+    '最高价': 'high',
+    '最低价': 'low',
+    '最新价': 'close',
+    '成交量': 'volume'
+}
+
+def trade_date_today():
+    """
+    获取当天日期（去除时间部分），作为缓存键使用
+    
+    返回:
+        pandas.Timestamp: 当天日期
+    """
+    return pd.to_datetime('today').normalize()
+
+@lru_cache(maxsize=None)
+def _load_etf_ohlcv(etf_code, trade_date):
+    """
+    下载并整理ETF历史行情 - 按(ETF代码, 交易日)缓存在内存和磁盘
+    
+    只保留trade_date之前已收盘的K线，当天盘中K线由调用方用实时行情补上，
+    因此磁盘缓存 CACHE_DIR/{etf_code}.parquet 当天任意时刻写入过都可直接读取，否则重新下载并覆盖
+    """
+    cache_path = os.path.join(CACHE_DIR, f"{etf_code}.parquet")
+    if (os.path.exists(cache_path) and
+            datetime.date.fromtimestamp(os.path.getmtime(cache_path)) == trade_date.date()):
+        return pd.read_parquet(cache_path, engine='pyarrow')
+    
+    # 统一列名后只取所需列并一次性完成类型转换，日期直接作为索引
+    raw = ak.fund_etf_hist_em(symbol=etf_code).rename(columns=COLUMN_MAP)
+    df = raw[list(OHLCV_DTYPES)].astype(OHLCV_DTYPES)
+    # akshare日期固定为YYYY-MM-DD，指定格式避免逐行推断；cache=True对重复值只解析一次
+    df.index = pd.DatetimeIndex(pd.to_datetime(raw['date'], format='%Y-%m-%d', cache=True), name='date')
+    if not df.index.is_monotonic_increasing:  # akshare按日期升序返回，通常无需排序
+        df = df.sort_index()
+    df = df[df.index < trade_date]  # 去掉当天未收盘的K线，避免盘中数据被缓存到收盘后
+    
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    df.to_parquet(cache_path, engine='pyarrow')
+    return df
+
+def get_etf_ohlcv(etf_code, trade_date=None):
+    """
+    获取ETF历史行情
+    
+    参数:
+        etf_code (str): ETF代码
+        trade_date (pandas.Timestamp): 交易日，默认为当天，仅用作缓存键
+        
+    返回:
+        pandas.DataFrame: 以日期为索引的open/high/low/close/volume数据，只含trade_date之前已收盘的K线，
+            为多个模块共享的缓存对象，调用方需要修改时应先复制
+    """
+    if trade_date is None:
+        trade_date = trade_date_today()
+    return _load_etf_ohlcv(etf_code, trade_date)
+
+def prefetch_etf_ohlcv(etf_codes, trade_date=None):
+    """
+    并发预取多只ETF的历史行情 - 网络请求为IO密集型，用线程池并行发出
+    
+    参数:
+        etf_codes (list): ETF代码列表
+        trade_date (pandas.Timestamp): 交易日，默认为当天
+    """
+    if trade_date is None:
+        trade_date = trade_date_today()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(_load_etf_ohlcv, code, trade_date): code for code in etf_codes}
+        for future in as_completed(futures):
+            if future.exception() is not None:  # 失败的请求不会被缓存，后续调用会重试
+                print(f"预取ETF {futures[future]} 历史数据失败: {future.exception()}")
+
+def fetch_etf_spot():
+    """
+    获取全部ETF的实时行情 - 整表只请求一次，转成按代码查找的字典
+    
+    返回:
+        dict: ETF代码 -> {'date', 'open', 'high', 'low', 'close', 'volume'}，
+            date为行情所属交易日，行情表提供数据日期时以其为准，否则为当天
+    """
+    spot = ak.fund_etf_spot_em()
+    if '数据日期' in spot.columns:
+        dates = pd.to_datetime(spot['数据日期']).dt.normalize()
+    else:
+        dates = trade_date_today()
+    bars = spot.rename(columns=SPOT_COLUMN_MAP)[['代码', *SPOT_COLUMN_MAP.values()]]
+    return bars.assign(date=dates).set_index('代码').to_dict('index')
+
+def is_complete_spot_bar(spot_bar):
+    """
+    判断实时行情是否可用 - 存在且开高低收和成交量都不为空
+    
+    参数:
+        spot_bar (dict): fetch_etf_spot返回的单只ETF行情，可以为None
+        
+    返回:
+        bool: 行情是否可用
+    """
+    return spot_bar is not None and not any(pd.isna(spot_bar[col]) for col in OHLCV_DTYPES)
+
+def is_new_spot_bar(hist_df, spot_bar):
+    """
+    判断实时行情是否晚于最后一根已收盘K线 - 非交易日或开盘前的行情与最后一根K线属于同一天
+    
+    参数:
+        hist_df (pandas.DataFrame): get_etf_ohlcv返回的已收盘K线
+        spot_bar (dict): fetch_etf_spot返回的单只ETF行情
+        
+    返回:
+        bool: 行情是否为新的一根K线
+    """
+    return not len(hist_df) or spot_bar['date'] > hist_df.index[-1]
+
+def append_spot_bar(hist_df, spot_bar):
+    """
+    把实时行情作为当天K线追加到历史行情之后 - 返回新的DataFrame，不修改共享的缓存对象
+    
+    参数:
+        hist_df (pandas.DataFrame): get_etf_ohlcv返回的已收盘K线
+        spot_bar (dict): fetch_etf_spot返回的单只ETF行情，为None时不追加
+        
+    返回:
+        pandas.DataFrame: 追加后的行情；行情缺失、价格无效或行情日期不晚于最后一根K线
+            （如非交易日）时原样返回hist_df
+    """
+    if not is_complete_spot_bar(spot_bar) or not is_new_spot_bar(hist_df, spot_bar):
+        return hist_df
+    bar = pd.DataFrame([spot_bar], index=pd.DatetimeIndex([spot_bar['date']], name='date'))
+    return pd.concat([hist_df, bar[list(OHLCV_DTYPES)].astype(OHLCV_DTYPES)])
+
+def minute_bucket():
+    """
+    获取当前时间所在的分钟编号，作为结果缓存键使用
+    
+    返回:
+        int: 自1970年以来的分钟数
+    """
+    return int(time.time() // 60)
+
+def load_result_cache(path, bucket):
+    """
+    读取同一分钟内已计算过的结果 - 重复运行时跳过网络请求和指标计算
+    
+    参数:
+        path (str): 结果缓存文件路径
+        bucket (int): 当前分钟编号
+        
+    返回:
+        dict: ETF代码 -> 结果字典；文件不存在、损坏或不属于当前分钟时返回空字典
+    """
+    try:
+        with open(path, 'rb') as f:
+            cached_bucket, results = pickle.load(f)
+    except Exception:
+        return {}
+    return results if cached_bucket == bucket else {}
+
+def save_result_cache(path, bucket, results):
+    """
+    保存当前分钟的计算结果，覆盖之前分钟的缓存
+    
+    参数:
+        path (str): 结果缓存文件路径
+        bucket (int): 当前分钟编号
+        results (dict): ETF代码 -> 结果字典
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as f:
+        pickle.dump((bucket, results), f)
@@ -0,0 +1,235 @@
+import os
+import pickle
+import numpy as np
+from collections import deque
+from dataclasses import dataclass, field
+from numba import njit
+
+# 风险监控的增量技术指标 - 用numba编译的内核一次遍历历史数据初始化状态，之后逐根K线递推更新。
+# 计算口径与ta库保持一致。
+# 价格输入为float32数组（与etf_data一致），递推累加量用float64保存；
+# 相邻收盘价之差在float32下是精确的，因此结果与先转成float64再计算相同。
+# 各内核都声明了显式签名，导入时即编译；cache=True把机器码写入__pycache__，
+# 之后的运行直接加载，不再重复编译。
+
+@njit('Tuple((float64[:], float64[:], float64[:]))(float32[:], float64[:], int64, int64, int64, int64)',
+      cache=True)
+def seed_indicator_state(close, volume, rsi_window, ema_short_window, ema_long_window, history):
+    """
+    一次遍历历史数据，计算IncrementalIndicators的全部递推状态 - 逐根update的编译版本
+    
+    参数:
+        close (numpy.ndarray): 收盘价数组（float32），至少一个元素
+        volume (numpy.ndarray): 成交量数组（float64）
+        rsi_window (int): RSI计算周期
+        ema_short_window (int): 短期EMA周期
+        ema_long_window (int): 长期EMA周期
+        history (int): 保留最近多少个RSI/OBV值
+        
+    返回:
+        tuple: (状态数组[ema_short, ema_long, prev_ema_short, prev_ema_long, avg_gain, avg_loss, obv],
+                最近的RSI值, 最近的OBV值)
+    """
+    n = len(close)
+    alpha_short = 2.0 / (ema_short_window + 1)
+    alpha_long = 2.0 / (ema_long_window + 1)
+    alpha = 1.0 / rsi_window
+    keep = min(n, history)
+    recent_rsi = np.empty(keep)
+    recent_obv = np.empty(keep)
+    
+    last_close = np.float64(close[0])
+    ema_short = last_close
+    ema_long = last_close
+    prev_ema_short = np.nan
+    prev_ema_long = np.nan
+    avg_gain = 0.0
+    avg_loss = 0.0
+    total = volume[0]
+    for i in range(n):
+        c = np.float64(close[i])  # 与update中的Python float运算保持逐位一致
+        if i > 0:
+            prev_ema_short = ema_short
+            prev_ema_long = ema_long
+            ema_short = alpha_short * c + (1 - alpha_short) * ema_short
+            ema_long = alpha_long * c + (1 - alpha_long) * ema_long
+            diff = c - last_close
+            gain = diff if diff > 0 else 0.0
+            loss = -diff if diff < 0 else 0.0
+            avg_gain = (1 - alpha) * avg_gain + alpha * gain
+            avg_loss = (1 - alpha) * avg_loss + alpha * loss
+            if c < last_close:
+                total -= volume[i]
+            else:
+                total += volume[i]
+        last_close = c
+        
+        k = i - (n - keep)  # 在最近值数组中的位置
+        if k >= 0:
+            if i + 1 < rsi_window:
+                recent_rsi[k] = np.nan
+            elif avg_loss == 0:
+                recent_rsi[k] = 100.0
+            else:
+                recent_rsi[k] = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+            recent_obv[k] = total
+    
+    state = np.array([ema_short, ema_long, prev_ema_short, prev_ema_long, avg_gain, avg_loss, total])
+    return state, recent_rsi, recent_obv
+
+@dataclass
+class IncrementalIndicators:
+    """
+    增量指标状态 - 保存EMA/RSI/OBV的递推状态，每根新K线只需O(1)更新，无需重算全部历史
+    
+    递推公式与上面的内核及ta库一致，从第一根K线开始逐根update得到的结果与批量计算相同。
+    recent_rsi/recent_obv 保留最近history个值，供顶背离检查使用。
+    """
+    rsi_window: int = 14
+    ema_short_window: int = 12
+    ema_long_window: int = 26
+    history: int = 5
+    count: int = 0                  # 已处理的K线数量
+    last_date: object = None        # 最后一根K线的日期
+    last_close: float = np.nan
+    ema_short: float = np.nan
+    ema_long: float = np.nan
+    prev_ema_short: float = np.nan  # 上一根K线的短期EMA
+    prev_ema_long: float = np.nan   # 上一根K线的长期EMA
+    avg_gain: float = 0.0
+    avg_loss: float = 0.0
+    obv: float = 0.0
+    recent_rsi: deque = field(default_factory=deque)
+    recent_obv: deque = field(default_factory=deque)
+    
+    def __post_init__(self):
+        self.recent_rsi = deque(self.recent_rsi, maxlen=self.history)
+        self.recent_obv = deque(self.recent_obv, maxlen=self.history)
+    
+    def update(self, close, volume, date=None):
+        """
+        用一根新K线更新状态
+        
+        参数:
+            close (float): 收盘价
+            volume (float): 成交量
+            date: K线日期，记录下来用于和历史数据对齐
+            
+        返回:
+            dict: 更新后的 ema_short/ema_long/rsi/obv，RSI数据不足时为NaN
+        """
+        if self.count == 0:
+            self.ema_short = close
+            self.ema_long = close
+            self.obv = volume
+        else:
+            alpha_short = 2.0 / (self.ema_short_window + 1)
+            alpha_long = 2.0 / (self.ema_long_window + 1)
+            self.prev_ema_short = self.ema_short
+            self.prev_ema_long = self.ema_long
+            self.ema_short = alpha_short * close + (1 - alpha_short) * self.ema_short
+            self.ema_long = alpha_long * close + (1 - alpha_long) * self.ema_long
+            
+            # Wilder平滑 - avg = avg*(n-1)/n + x/n
+            alpha = 1.0 / self.rsi_window
+            diff = close - self.last_close
+            gain = diff if diff > 0 else 0.0
+            loss = -diff if diff < 0 else 0.0
+            self.avg_gain = (1 - alpha) * self.avg_gain + alpha * gain
+            self.avg_loss = (1 - alpha) * self.avg_loss + alpha * loss
+            
+            self.obv += -volume if close < self.last_close else volume
+        
+        self.count += 1
+        self.last_close = close
+        self.last_date = date
+        
+        if self.count < self.rsi_window:
+            rsi = np.nan
+        elif self.avg_loss == 0:
+            rsi = 100.0
+        else:
+            rsi = 100.0 - 100.0 / (1.0 + self.avg_gain / self.avg_loss)
+        self.recent_rsi.append(rsi)
+        self.recent_obv.append(self.obv)
+        
+        return {
+            'ema_short': self.ema_short,
+            'ema_long': self.ema_long,
+            'rsi': rsi,
+            'obv': self.obv
+        }
+    
+    def extend(self, close, volume, dates):
+        """
+        按顺序用多根K线更新状态
+        
+        参数:
+            close (numpy.ndarray): 收盘价数组
+            volume (numpy.ndarray): 成交量数组
+            dates: 与收盘价对应的日期序列
+            
+        返回:
+            IncrementalIndicators: 更新后的状态本身
+        """
+        for c, v, d in zip(close.tolist(), volume.tolist(), dates):
+            self.update(c, v, d)
+        return self
+    
+    @classmethod
+    def from_history(cls, close, volume, dates, **params):
+        """
+        用历史数据初始化状态 - 由编译内核seed_indicator_state一次遍历完成，结果与逐根update相同
+        
+        参数:
+            close (numpy.ndarray): 收盘价数组
+            volume (numpy.ndarray): 成交量数组
+            dates: 与收盘价对应的日期序列
+            **params: 传给构造函数的指标周期参数
+            
+        返回:
+            IncrementalIndicators: 已处理完全部历史K线的状态
+        """
+        state = cls(**params)
+        if len(close) == 0:
+            return state
+        # pandas的to_numpy()可能返回只读数组，复制一份以匹配内核的显式签名
+        values, recent_rsi, recent_obv = seed_indicator_state(
+            close.astype(np.float32), volume.astype(np.float64),
+            state.rsi_window, state.ema_short_window, state.ema_long_window, state.history)
+        (state.ema_short, state.ema_long, state.prev_ema_short, state.prev_ema_long,
+         state.avg_gain, state.avg_loss, state.obv) = values.tolist()
+        state.count = len(close)
+        state.last_close = float(close[-1])
+        state.last_date = dates[-1]
+        state.recent_rsi.extend(recent_rsi.tolist())
+        state.recent_obv.extend(recent_obv.tolist())
+        return state
+
+def load_indicator_states(path):
+    """
+    从pickle文件读取各ETF的增量指标状态
+    
+    参数:
+        path (str): 状态文件路径
+        
+    返回:
+        dict: ETF代码 -> IncrementalIndicators，文件不存在或损坏时返回空字典
+    """
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return {}
+
+def save_indicator_states(states, path):
+    """
+    把各ETF的增量指标状态写入pickle文件
+    
+    参数:
+        states (dict): ETF代码 -> IncrementalIndicators
+        path (str): 状态文件路径
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as f:
+        pickle.dump(states, f)
@@ -1,9 +1,10 @@
-import akshare as ak
-import pandas as pd
+import os
+import csv
+import copy
 import numpy as np
-from ta.momentum import RSIIndicator
-from ta.volume import OnBalanceVolumeIndicator
-from ta.trend import EMAIndicator
+from etf_indicators import IncrementalIndicators, load_indicator_states, save_indicator_states
+from etf_data import (CACHE_DIR, get_etf_ohlcv, prefetch_etf_ohlcv, fetch_etf_spot, is_complete_spot_bar,
+                      is_new_spot_bar, minute_bucket, load_result_cache, save_result_cache)
 
 # 配置参数
 ETF_CODES = [
@@ -16,137 +17,178 @@ ETF_CODES = [
 RSI_PERIOD = 14  # RSI指标计算周期
 EMA_SHORT = 12   # 短期EMA周期
 EMA_LONG = 26    # 长期EMA周期
+STATE_FILE = os.path.join(CACHE_DIR, 'indicator_state.pkl')  # 增量指标状态文件
+RESULT_CACHE_FILE = os.path.join(CACHE_DIR, 'risk_monitor_results.pkl')  # 同一分钟内的监测结果缓存
 
-def get_etf_data(etf_code):
+indicator_states = {}  # ETF代码 -> 增量指标状态，main中从STATE_FILE加载
+
+def get_etf_data(etf_code, realtime_data):
     """
     获取ETF历史数据和实时数据
     
+    实时数据以标量形式单独返回，不追加到历史数据中，避免整表复制
+    
     参数:
         etf_code (str): ETF代码
+        realtime_data (dict): fetch_etf_spot返回的该ETF实时行情，为None或价格为空时视为获取失败
         
     返回:
-        pandas.DataFrame: 包含收盘价和成交量的DataFrame，索引为日期
+        tuple: (当天之前的历史数据DataFrame, 最新价, 最新成交量, 行情是否为新的一根K线)，获取失败时返回None
     """
     try:
-        # 获取历史数据 - 使用akshare获取ETF历史行情
-        hist_df = ak.fund_etf_hist_em(symbol=etf_code)
-        # 获取实时数据 - 使用akshare获取ETF实时行情
-        realtime_df = ak.fund_etf_spot_em()
-        # 筛选出当前ETF的实时数据
-        realtime_data = realtime_df[realtime_df['代码'] == etf_code].iloc[0]
+        if realtime_data is None:
+            raise KeyError(f"实时行情中没有 {etf_code}")
+        if not is_complete_spot_bar(realtime_data):  # 空值会让顶背离检查误判
+            raise ValueError(f"实时行情价格为空 {etf_code}")
         
-        # 处理历史数据列名 - 兼容不同版本的列名
-        hist_df['date'] = pd.to_datetime(hist_df['日期'] if '日期' in hist_df.columns else hist_df['date'])
-        hist_df['close'] = hist_df['收盘'].astype(float) if '收盘' in hist_df.columns else hist_df['close'].astype(float)
-        hist_df['volume'] = hist_df['成交量'].astype(float) if '成交量' in hist_df.columns else hist_df['volume'].astype(float)
-        hist_df.set_index('date', inplace=True)  # 设置日期为索引
+        # 获取历史数据 - 只含当天之前已收盘的K线，当天由实时数据代替
+        hist_df = get_etf_ohlcv(etf_code)
         
-        # 添加最新实时数据到历史数据中
-        latest_data = {
-            'close': float(realtime_data['最新价']),  # 最新收盘价
-            'volume': float(realtime_data['成交量'])   # 最新成交量
-        }
-        latest_date = pd.to_datetime('today').normalize()  # 获取当天日期（去除时间部分）
-        hist_df.loc[latest_date] = latest_data  # 添加最新数据
-        
-        return hist_df[['close', 'volume']].sort_index()  # 返回排序后的收盘价和成交量数据
+        latest_close = float(np.float32(realtime_data['close']))  # 最新收盘价，与历史价格同为float32精度
+        latest_volume = float(realtime_data['volume'])             # 最新成交量
+        return hist_df, latest_close, latest_volume, is_new_spot_bar(hist_df, realtime_data)
     except Exception as e:
         print(f"获取ETF {etf_code} 数据失败: {e}")
         return None
 
-def check_rsi_divergence(df):
+def get_indicator_state(etf_code, hist_df):
+    """
+    获取ETF的增量指标状态，并补齐到hist_df的最后一根K线
+    
+    已保存的状态只需处理其后新增的K线；没有状态、参数变化或与历史数据对不上时，
+    从全部历史数据重新初始化
+    
+    参数:
+        etf_code (str): ETF代码
+        hist_df (pandas.DataFrame): 已收盘的历史数据（不含当天实时数据）
+        
+    返回:
+        IncrementalIndicators: 覆盖hist_df全部K线的指标状态
+    """
+    params = {'rsi_window': RSI_PERIOD, 'ema_short_window': EMA_SHORT, 'ema_long_window': EMA_LONG}
+    state = indicator_states.get(etf_code)
+    if (state is None or
+            any(getattr(state, k) != v for k, v in params.items()) or
+            state.last_date not in hist_df.index or
+            hist_df.at[state.last_date, 'close'] != state.last_close):
+        state = IncrementalIndicators.from_history(
+            hist_df['close'].to_numpy(),
+            hist_df['volume'].to_numpy(),
+            hist_df.index, **params)
+    else:
+        # 先切出状态之后新增的K线，只转换这一小段数据
+        new_rows = hist_df.iloc[hist_df.index.get_loc(state.last_date) + 1:]
+        state.extend(new_rows['close'].to_numpy(),
+                     new_rows['volume'].to_numpy(),
+                     new_rows.index)
+    indicator_states[etf_code] = state
+    return state
+
+def is_latest_max(values):
+    """
+    判断最大值是否出现在最后一个位置 - 直接比较numpy数组的整数位置，不构造pandas索引
+    
+    参数:
+        values (numpy.ndarray): 一维数组
+        
+    返回:
+        bool: 最大值（并列时取第一个）是否为最后一个元素
+    """
+    return bool(values.argmax() == len(values) - 1)
+
+def check_rsi_divergence(last_5_close, indicators):
     """
     检查RSI顶背离 - 价格创新高但RSI指标未创新高
     
     参数:
-        df (pandas.DataFrame): 包含收盘价的数据框
+        last_5_close (numpy.ndarray): 最近5个周期的收盘价（含最新价）
+        indicators (IncrementalIndicators): 已更新到最新价的指标状态
         
     返回:
         bool: 是否存在RSI顶背离
     """
-    if len(df) < RSI_PERIOD + 5:  # 确保数据长度足够计算RSI和检查背离
+    if indicators.count < RSI_PERIOD + 5:  # 确保数据长度足够计算RSI和检查背离
         return False
     
-    # 计算RSI指标 - 使用ta库计算相对强弱指数
-    rsi = RSIIndicator(df['close'], window=RSI_PERIOD).rsi()
-    
     # 检查最近5个周期是否存在顶背离
-    last_5 = df['close'].tail(5)      # 最近5个周期的收盘价
-    last_5_rsi = rsi.tail(5)          # 最近5个周期的RSI值
+    last_5_rsi = np.array(indicators.recent_rsi)  # 最近5个周期的RSI值
     
     # 价格创新高但RSI未创新高 - 典型的顶背离信号
-    if (last_5.idxmax() == last_5.index[-1] and  # 价格最高点在最近一个周期
-        last_5_rsi.idxmax() != last_5_rsi.index[-1]):  # RSI最高点不在最近一个周期
-        return True
-    return False
+    return (is_latest_max(last_5_close) and    # 价格最高点在最近一个周期
+            not is_latest_max(last_5_rsi))     # RSI最高点不在最近一个周期
 
-def check_obv_divergence(df):
+def check_obv_divergence(last_5_close, indicators):
     """
     检查OBV顶背离 - 价格创新高但能量潮指标未创新高
     
     参数:
-        df (pandas.DataFrame): 包含收盘价和成交量的数据框
+        last_5_close (numpy.ndarray): 最近5个周期的收盘价（含最新价）
+        indicators (IncrementalIndicators): 已更新到最新价的指标状态
         
     返回:
         bool: 是否存在OBV顶背离
     """
-    if len(df) < 10:  # 确保数据长度足够检查背离
+    if indicators.count < 10:  # 确保数据长度足够检查背离
         return False
     
-    # 计算OBV指标 - 使用ta库计算能量潮指标
-    obv = OnBalanceVolumeIndicator(df['close'], df['volume']).on_balance_volume()
-    
     # 检查最近5个周期
-    last_5_close = df['close'].tail(5)  # 最近5个周期的收盘价
-    last_5_obv = obv.tail(5)           # 最近5个周期的OBV值
+    last_5_obv = np.array(indicators.recent_obv)  # 最近5个周期的OBV值
     
     # 价格创新高但OBV未创新高 - 量价背离信号
-    if (last_5_close.idxmax() == last_5_close.index[-1] and  # 价格最高点在最近一个周期
-        last_5_obv.idxmax() != last_5_obv.index[-1]):        # OBV最高点不在最近一个周期
-        return True
-    return False
+    return (is_latest_max(last_5_close) and    # 价格最高点在最近一个周期
+            not is_latest_max(last_5_obv))     # OBV最高点不在最近一个周期
 
-def check_ema_death_cross(df):
+def check_ema_death_cross(indicators):
     """
     检查EMA死叉 - 短期EMA下穿长期EMA形成的卖出信号
     
     参数:
-        df (pandas.DataFrame): 包含收盘价的数据框
+        indicators (IncrementalIndicators): 已更新到最新价的指标状态
         
     返回:
         bool: 是否出现EMA死叉
     """
-    if len(df) < EMA_LONG + 1:  # 确保数据长度足够计算长期EMA
+    if indicators.count < EMA_LONG + 1:  # 确保数据长度足够计算长期EMA
         return False
     
-    # 计算EMA指标 - 使用ta库计算指数移动平均线
-    ema_short = EMAIndicator(df['close'], window=EMA_SHORT).ema_indicator()  # 短期EMA
-    ema_long = EMAIndicator(df['close'], window=EMA_LONG).ema_indicator()    # 长期EMA
-    
     # 检查是否出现死叉 - 短期EMA从上向下穿过长期EMA
-    return (ema_short.iloc[-2] > ema_long.iloc[-2] and  # 前一个周期短期EMA在长期EMA之上
-            ema_short.iloc[-1] < ema_long.iloc[-1])    # 当前周期短期EMA在长期EMA之下
+    return (indicators.prev_ema_short > indicators.prev_ema_long and  # 前一个周期短期EMA在长期EMA之上
+            indicators.ema_short < indicators.ema_long)              # 当前周期短期EMA在长期EMA之下
 
-def monitor_etf(etf_code):
+def monitor_etf(etf_code, realtime_data):
     """
     监控单个ETF的风险指标
     
     参数:
         etf_code (str): ETF代码
+        realtime_data (dict): fetch_etf_spot返回的该ETF实时行情
         
     返回:
         dict: 包含各项风险指标的字典，如果获取数据失败则返回None
     """
-    df = get_etf_data(etf_code)  # 获取ETF数据
-    if df is None:  # 数据获取失败
+    data = get_etf_data(etf_code, realtime_data)  # 获取ETF数据
+    if data is None:  # 数据获取失败
         return None
+    hist_df, latest_close, latest_volume, is_new_bar = data
+    
+    # 已收盘K线并入持久化状态
+    indicators = get_indicator_state(etf_code, hist_df)
+    if is_new_bar:
+        # 最新价盘中还会变化，只在副本上更新
+        indicators = copy.deepcopy(indicators)
+        indicators.update(latest_close, latest_volume)
+        # 最近5个周期的收盘价 - 最新价只追加到这个短数组中
+        last_5_close = np.append(hist_df['close'].to_numpy()[-4:], np.float32(latest_close))
+    else:
+        # 非交易日或开盘前，行情就是最后一根已收盘K线，不再重复计入
+        last_5_close = hist_df['close'].to_numpy()[-5:]
     
     return {
         'ETF代码': etf_code,  # ETF代码
-        '最新价格': round(df['close'].iloc[-1], 3),  # 最新收盘价，保留3位小数
-        'RSI顶背离': check_rsi_divergence(df),  # RSI顶背离信号
-        'OBV顶背离': check_obv_divergence(df),  # OBV顶背离信号
-        'EMA死叉': check_ema_death_cross(df)    # EMA死叉信号
+        '最新价格': round(latest_close, 3),  # 最新收盘价，保留3位小数
+        'RSI顶背离': check_rsi_divergence(last_5_close, indicators),  # RSI顶背离信号
+        'OBV顶背离': check_obv_divergence(last_5_close, indicators),  # OBV顶背离信号
+        'EMA死叉': check_ema_death_cross(indicators)                 # EMA死叉信号
     }
 
 def main():
@@ -154,10 +196,32 @@ def main():
     主函数 - 执行ETF持仓风险监测
     """
     print("开始ETF持仓风险监测...")
+    # 同一分钟内已监测过的ETF直接复用结果，全部命中时无需访问网络
+    bucket = minute_bucket()
+    monitored = load_result_cache(RESULT_CACHE_FILE, bucket)
+    pending = [code for code in ETF_CODES if code not in monitored]
+    if pending:
+        try:
+            # 实时行情表只获取一次，转成按代码查找的字典
+            spot = fetch_etf_spot()
+        except Exception as e:
+            print(f"获取ETF实时行情失败: {e}")
+            return
+        prefetch_etf_ohlcv(pending)  # 并发预取历史数据
+        indicator_states.update(load_indicator_states(STATE_FILE))  # 加载上次保存的增量指标状态
+        
+        # 单只ETF的监控只需几毫秒，逐个串行计算；增量指标状态直接更新在indicator_states中
+        for etf_code in pending:
+            result = monitor_etf(etf_code, spot.get(etf_code))
+            if result:  # 失败的结果不缓存，下次运行重试
+                monitored[etf_code] = result
+        save_indicator_states(indicator_states, STATE_FILE)
+        save_result_cache(RESULT_CACHE_FILE, bucket, monitored)
+    
     results = []  # 存储所有ETF的监测结果
     for etf_code in ETF_CODES:  # 遍历所有ETF代码
         print(f"\n正在分析ETF {etf_code}...")
-        result = monitor_etf(etf_code)  # 监控单个ETF
+        result = monitored.get(etf_code)
         if result:  # 如果监控成功
             results.append(result)  # 添加到结果列表
             print(f"最新价格: {result['最新价格']}")
@@ -166,8 +230,11 @@ def main():
             print(f"EMA死叉: {'是' if result['EMA死叉'] else '否'}")
     
     if results:  # 如果有有效结果
-        # 保存结果到CSV文件 - 使用utf_8_sig编码支持中文
-        pd.DataFrame(results).to_csv('etf_risk_monitor.csv', index=False, encoding='utf_8_sig')
+        # 保存结果到CSV文件 - 使用utf_8_sig编码支持中文；结果只有几行，直接写出不经过DataFrame
+        with open('etf_risk_monitor.csv', 'w', newline='', encoding='utf_8_sig') as f:
+            writer = csv.DictWriter(f, fieldnames=results[0].keys())
+            writer.writeheader()
+            writer.writerows(results)
         print("\n监测结果已保存到 etf_risk_monitor.csv")
     else:
         print("没有有效的监测结果")
@@ -1,82 +1,47 @@
-import akshare as ak
 import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
-from ta.trend import ADXIndicator, macd
-from ta.momentum import RSIIndicator
+from etf_trend_signals import latest_trend_signals, stack_padded
+from etf_data import get_etf_ohlcv, prefetch_etf_ohlcv, fetch_etf_spot, append_spot_bar
 
 # 设置中文字体
 plt.rcParams['font.sans-serif'] = ['SimHei']
 plt.rcParams['axes.unicode_minus'] = False
 
-def get_etf_data(etf_code):
-    """获取ETF数据"""
+def get_etf_data(etf_code, spot_bar=None):
+    """获取ETF数据，并以实时行情作为当天K线"""
     try:
-        # 使用akshare获取ETF数据 - 正确方法
-        df = ak.fund_etf_hist_em(symbol=etf_code)
-        
-        # 检查数据列名，akshare可能返回中文列名
-        if '日期' in df.columns:
-            df['date'] = pd.to_datetime(df['日期'])
-        elif 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'])
-        else:
-            print("数据列名不匹配，尝试使用第一列作为日期")
-            df['date'] = pd.to_datetime(df.iloc[:, 0])
-            
-        df.set_index('date', inplace=True)
-        df.sort_index(inplace=True)
-        
-        # 确保有必要的价格数据列
-        if '收盘' in df.columns:
-            df['close'] = df['收盘']
-        elif 'close' in df.columns:
-            pass  # 已有close列
-        else:
-            print("无法找到收盘价数据列")
-            return None
-            
-        if '最高' in df.columns:
-            df['high'] = df['最高']
-        if '最低' in df.columns:
-            df['low'] = df['最低']
-            
-        return df
+        # 没有可追加的实时行情时返回共享缓存对象，后续只读不写
+        return append_spot_bar(get_etf_ohlcv(etf_code), spot_bar)
     except Exception as e:
         print(f"获取ETF数据失败: {str(e)}")
         return None
 
-def calculate_technical_indicators(df):
-    """计算技术指标"""
-    if df is None or len(df) < 30:
-        return None
-    
-    # 计算ADX (14天周期)
-    adx_indicator = ADXIndicator(df['high'], df['low'], df['close'], window=14)
-    df['ADX'] = adx_indicator.adx()
+def compute_latest_signals(etf_frames):
+    """批量计算多只ETF最新一个周期的技术指标值，只返回标量，不生成整列指标"""
+    codes = list(etf_frames)
     
-    # 计算MACD (使用ta库的正确参数)
-    df['MACD_DIF'] = df['close'].ewm(span=12, adjust=False).mean() - df['close'].ewm(span=26, adjust=False).mean()
-    df['MACD_DEA'] = df['MACD_DIF'].ewm(span=9, adjust=False).mean()
+    # 计算ADX (14天周期)、MACD (12/26/9) 和 RSI (14天周期) - 所有ETF堆叠后一次调用并行内核
+    high_matrix, lengths = stack_padded([etf_frames[code]['high'].to_numpy() for code in codes])
+    low_matrix, _ = stack_padded([etf_frames[code]['low'].to_numpy() for code in codes])
+    close_matrix, _ = stack_padded([etf_frames[code]['close'].to_numpy() for code in codes])
+    adx, macd_dif, macd_dea, rsi = latest_trend_signals(high_matrix, low_matrix, close_matrix, lengths)
     
-    # 计算RSI (14天周期)
-    rsi_indicator = RSIIndicator(df['close'], window=14)
-    df['RSI'] = rsi_indicator.rsi()
-    
-    return df
+    signals = {}
+    for i, code in enumerate(codes):
+        signals[code] = {
+            'ADX': adx[i],
+            'MACD_DIF': macd_dif[i],
+            'MACD_DEA': macd_dea[i],
+            'RSI': rsi[i]
+        }
+    return signals
 
-def evaluate_trend(df, etf_code):
+def evaluate_trend(signals, etf_code):
     """评估趋势并计算评分"""
-    if df is None or len(df) < 30:
-        return None
-    
-    # 获取最新指标值
-    latest = df.iloc[-1]
-    
     # 计算各项指标
-    adx_value = latest['ADX']
-    macd_status = '是' if latest['MACD_DIF'] > 0 and latest['MACD_DEA'] > 0 else '否'
-    rsi_value = latest['RSI']
+    adx_value = signals['ADX']
+    macd_status = '是' if signals['MACD_DIF'] > 0 and signals['MACD_DEA'] > 0 else '否'
+    rsi_value = signals['RSI']
     
     # 计算各项评分
     adx_score = min(adx_value, 50) / 50 * 100
@@ -98,28 +63,37 @@ def evaluate_trend(df, etf_code):
 def evaluate_multiple_etfs(etf_codes):
     """批量评估多个ETF"""
     results = []
+    etf_frames = {}  # 数据充足的ETF，统一批量计算指标
+    prefetch_etf_ohlcv(etf_codes)
+    # 磁盘缓存只有已收盘的K线，当天K线来自实时行情；获取失败时只用已收盘的K线评估
+    try:
+        spot = fetch_etf_spot()
+    except Exception as e:
+        print(f"获取ETF实时行情失败: {e}")
+        spot = {}
     
     for etf_code in etf_codes:
         print(f"\n正在处理ETF {etf_code}...")
         
         # 获取数据
-        etf_data = get_etf_data(etf_code)
+        etf_data = get_etf_data(etf_code, spot.get(etf_code))
         if etf_data is None:
             print(f"ETF {etf_code} 数据获取失败")
             continue
             
         print(f"数据时间范围: {etf_data.index[0].date()} 到 {etf_data.index[-1].date()}")
         
-        # 计算技术指标
-        etf_data = calculate_technical_indicators(etf_data)
-        if etf_data is None:
+        if len(etf_data) < 30:
             print(f"ETF {etf_code} 数据不足")
             continue
-            
+        etf_frames[etf_code] = etf_data
+    
+    # 计算技术指标
+    signals = compute_latest_signals(etf_frames) if etf_frames else {}
+    
+    for etf_code in etf_frames:
         # 评估趋势
-        evaluation = evaluate_trend(etf_data, etf_code)
-        if evaluation:
-            results.append(evaluation)
+        results.append(evaluate_trend(signals[etf_code], etf_code))
     
     if not results:
         print("\n没有有效的评估结果")
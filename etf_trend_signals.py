@@ -0,0 +1,178 @@
+import numpy as np
+from numba import njit, guvectorize, float32, float64, int64
+
+# 趋势评估的技术指标计算内核 - 用numba编译为机器码，一次遍历价格数组得到最新的ADX、MACD和RSI，
+# 避免ta库为每个指标构造完整的pandas Series。计算口径与ta库保持一致。
+# 价格输入为float32数组（与etf_data一致），递推累加量用float64保存。
+# 各内核都声明了显式签名，导入时即编译；cache=True把机器码写入__pycache__，之后的运行直接加载。
+# 批量内核latest_trend_signals使用numba并行线程池，因此与风险监控用的etf_indicators分开，
+# 只在趋势评估中导入。
+
+PRICE_SCALE = 1000.0  # 场内ETF价格的最小变动单位为0.001元
+
+@njit('float64(float32)', cache=True)
+def tick_price(price):
+    """
+    把float32价格还原为按最小变动单位取整的float64价格，与直接解析行情得到的float64值逐位相同
+    
+    参数:
+        price (float): float32价格
+        
+    返回:
+        float: float64价格
+    """
+    return np.rint(np.float64(price) * PRICE_SCALE) / PRICE_SCALE
+
+@njit('UniTuple(float64, 3)(float32[:], float32[:], float32[:], int64)', cache=True)
+def directional_movement(high, low, close, i):
+    """
+    计算第i个周期（i>=1）的真实波幅和上升/下降动向
+    
+    DM只在一个方向的变动严格大于另一方向时计入，变动相等附近的比较对舍入误差很敏感，
+    因此先把价格还原为float64行情值再计算，结果与ta在float64价格上的计算一致
+    
+    返回:
+        tuple: (真实波幅TR, +DM, -DM)
+    """
+    prev_close = tick_price(close[i - 1])
+    tr = max(tick_price(high[i]), prev_close) - min(tick_price(low[i]), prev_close)
+    diff_up = tick_price(high[i]) - tick_price(high[i - 1])
+    diff_down = tick_price(low[i - 1]) - tick_price(low[i])
+    plus_dm = diff_up if diff_up > diff_down and diff_up > 0 else 0.0
+    minus_dm = diff_down if diff_down > diff_up and diff_down > 0 else 0.0
+    return tr, plus_dm, minus_dm
+
+@njit('float64(float64, float64, float64)', cache=True)
+def directional_index(tr_sm, plus_dm_sm, minus_dm_sm):
+    """
+    由平滑后的TR、+DM、-DM计算DX，分母为0时记0，与ta口径一致
+    
+    返回:
+        float: DX值
+    """
+    di_plus = 100 * (plus_dm_sm / tr_sm) if tr_sm != 0 else 0.0
+    di_minus = 100 * (minus_dm_sm / tr_sm) if tr_sm != 0 else 0.0
+    if di_plus + di_minus != 0:
+        return 100 * abs((di_plus - di_minus) / (di_plus + di_minus))
+    return 0.0
+
+@njit('UniTuple(float64, 4)(float32[:], float32[:], float32[:], int64, int64, int64, int64, int64)', cache=True)
+def trend_signals_last(high, low, close, adx_window, fast_window, slow_window, signal_window, rsi_window):
+    """
+    一次遍历同时计算最新一个周期的ADX、MACD快慢线和RSI - 所有递推状态都保存在局部变量中，价格数组只读一遍
+    
+    计算口径与ta库一致：ADX同ta.trend.ADXIndicator(...).adx().iloc[-1]，MACD同pandas ewm(span, adjust=False)，
+    RSI同ta.momentum.RSIIndicator(Wilder平滑，alpha=1/window)
+    
+    参数:
+        high (numpy.ndarray): 最高价数组（float32）
+        low (numpy.ndarray): 最低价数组（float32）
+        close (numpy.ndarray): 收盘价数组（float32）
+        adx_window (int): ADX计算周期
+        fast_window (int): MACD快速EMA周期
+        slow_window (int): MACD慢速EMA周期
+        signal_window (int): MACD DEA平滑周期
+        rsi_window (int): RSI计算周期
+        
+    返回:
+        tuple: (ADX, DIF, DEA, RSI)，数据不足时ADX或RSI为NaN
+    """
+    n = len(close)
+    # MACD状态
+    alpha_fast = 2.0 / (fast_window + 1)
+    alpha_slow = 2.0 / (slow_window + 1)
+    alpha_signal = 2.0 / (signal_window + 1)
+    ema_fast = np.float64(close[0])
+    ema_slow = np.float64(close[0])
+    dif = 0.0
+    dea = 0.0
+    # RSI状态
+    alpha_rsi = 1.0 / rsi_window
+    avg_gain = 0.0
+    avg_loss = 0.0
+    # ADX状态 - ta的平滑序列长度为m，首项为第1到adx_window个周期的累加，
+    # 最后一项不再平滑（为0），因此只用到倒数第二个周期为止的DX
+    m = n - (adx_window - 1)
+    tr_sm = 0.0
+    plus_dm_sm = 0.0
+    minus_dm_sm = 0.0
+    dx_sum = 0.0
+    adx = 0.0
+    
+    for i in range(1, n):
+        c = np.float64(close[i])
+        ema_fast = alpha_fast * c + (1 - alpha_fast) * ema_fast
+        ema_slow = alpha_slow * c + (1 - alpha_slow) * ema_slow
+        dif = ema_fast - ema_slow
+        dea = alpha_signal * dif + (1 - alpha_signal) * dea
+        
+        diff = c - np.float64(close[i - 1])
+        gain = diff if diff > 0 else 0.0
+        loss = -diff if diff < 0 else 0.0
+        avg_gain = (1 - alpha_rsi) * avg_gain + alpha_rsi * gain
+        avg_loss = (1 - alpha_rsi) * avg_loss + alpha_rsi * loss
+        
+        tr, plus_dm, minus_dm = directional_movement(high, low, close, i)
+        if i <= adx_window:  # 第1到adx_window个周期累加为平滑初值
+            tr_sm += tr
+            plus_dm_sm += plus_dm
+            minus_dm_sm += minus_dm
+            if i < adx_window:
+                continue
+        else:
+            tr_sm = tr_sm - (tr_sm / adx_window) + tr
+            plus_dm_sm = plus_dm_sm - (plus_dm_sm / adx_window) + plus_dm
+            minus_dm_sm = minus_dm_sm - (minus_dm_sm / adx_window) + minus_dm
+        k = i - adx_window  # 在ta平滑序列中的位置
+        dx = directional_index(tr_sm, plus_dm_sm, minus_dm_sm)
+        if k < adx_window:
+            dx_sum += dx
+            if k == adx_window - 1:
+                adx = dx_sum / adx_window
+        else:
+            adx = ((adx * (adx_window - 1)) + dx) / adx_window
+    
+    if m <= adx_window:
+        adx = np.nan
+    if n < 2 or n - 1 < rsi_window - 1:
+        rsi = np.nan
+    elif avg_loss == 0:
+        rsi = 100.0
+    else:
+        rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    return adx, dif, dea, rsi
+
+@guvectorize([(float32[:], float32[:], float32[:], int64, float64[:], float64[:], float64[:], float64[:])],
+             '(n),(n),(n),()->(),(),(),()', target='parallel', cache=True)
+def latest_trend_signals(high, low, close, valid_len, adx, macd_dif, macd_dea, rsi):
+    """
+    批量计算多只ETF最新一个周期的ADX(14)、MACD(12/26/9)和RSI(14) - 每行一只ETF，并行计算
+    
+    参数:
+        high (numpy.ndarray): 二维float32最高价数组，每行左对齐，超出有效长度的部分为填充值
+        low (numpy.ndarray): 二维float32最低价数组，布局同high
+        close (numpy.ndarray): 二维float32收盘价数组，布局同high
+        valid_len (numpy.ndarray): 每行的有效数据长度
+        
+    返回:
+        tuple: (ADX数组, DIF数组, DEA数组, RSI数组)，与输入行一一对应
+    """
+    adx[0], macd_dif[0], macd_dea[0], rsi[0] = trend_signals_last(
+        high[:valid_len], low[:valid_len], close[:valid_len], 14, 12, 26, 9, 14)
+
+def stack_padded(arrays, dtype=np.float32):
+    """
+    把长度不同的一维数组左对齐堆叠成二维数组，供批量内核使用
+    
+    参数:
+        arrays (list): 一维数组列表
+        dtype: 输出数组类型
+        
+    返回:
+        tuple: (二维数组, 每行有效长度数组)，填充位置为NaN
+    """
+    lengths = np.array([len(a) for a in arrays], dtype=np.int64)
+    matrix = np.full((len(arrays), lengths.max()), np.nan, dtype=dtype)
+    for row, a in zip(matrix, arrays):
+        row[:len(a)] = a
+    return matrix, lengths
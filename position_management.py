@@ -1,12 +1,16 @@
-import akshare as ak
+import os
+import csv
 import pandas as pd
 import numpy as np
+from etf_data import (CACHE_DIR, get_etf_ohlcv, prefetch_etf_ohlcv, fetch_etf_spot, append_spot_bar,
+                      minute_bucket, load_result_cache, save_result_cache)
 
 # ================= 配置参数 =================
 # 风险控制参数
 MAX_LOSS_PER_ETF = 150  # 单只ETF最大亏损承受额(元)
 ATR_PERIOD = 14        # ATR计算周期
 ATR_MULTIPLIER = 2     # ATR系数
+RESULT_CACHE_FILE = os.path.join(CACHE_DIR, 'position_results.pkl')  # 同一分钟内的计算结果缓存
 
 # 需要评估的ETF代码列表
 ETF_CODES = [
@@ -17,47 +21,29 @@ ETF_CODES = [
     '510300'   # 沪深300ETF
 ]
 
-def get_etf_data(etf_code):
-    """获取ETF历史数据"""
+def get_etf_data(etf_code, spot_bar=None):
+    """获取ETF历史数据，并以实时行情作为当天K线"""
     try:
-        df = ak.fund_etf_hist_em(symbol=etf_code)
-        # 处理中文列名
-        if '日期' in df.columns:
-            df['date'] = pd.to_datetime(df['日期'])
-            df['close'] = df['收盘'].astype(float)
-            df['high'] = df['最高'].astype(float)
-            df['low'] = df['最低'].astype(float)
-        else:
-            df['date'] = pd.to_datetime(df['date'])
-            df['close'] = df['close'].astype(float)
-            df['high'] = df['high'].astype(float)
-            df['low'] = df['low'].astype(float)
-            
-        df.set_index('date', inplace=True)
-        df.sort_index(inplace=True)
-        return df[['high', 'low', 'close']]
+        return append_spot_bar(get_etf_ohlcv(etf_code), spot_bar)[['high', 'low', 'close']]
     except Exception as e:
         print(f"获取ETF {etf_code} 数据失败: {e}")
         return None
 
-def calculate_position(etf_code):
+def calculate_position(etf_code, spot_bar=None):
     """计算入场仓位和止损百分比"""
     try:
         # 获取历史数据
-        df = get_etf_data(etf_code)
-        if df is None or len(df) < ATR_PERIOD:
+        df = get_etf_data(etf_code, spot_bar)
+        if df is None or len(df) < ATR_PERIOD + 1:  # 需要多一根K线提供前收盘价
             return None
             
-        # 计算ATR
-        df['tr'] = np.maximum(
-            df['high'] - df['low'],
-            np.maximum(
-                abs(df['high'] - df['close'].shift(1)),
-                abs(df['low'] - df['close'].shift(1))
-            )
-        )
-        latest_atr = df['tr'].tail(ATR_PERIOD).mean()
-        current_price = df['close'].iloc[-1]
+        # 计算ATR - 只取最近ATR_PERIOD根K线的真实波幅，直接在numpy数组上计算
+        high = df['high'].to_numpy()[-ATR_PERIOD:]
+        low = df['low'].to_numpy()[-ATR_PERIOD:]
+        prev_close = df['close'].to_numpy()[-ATR_PERIOD - 1:-1]
+        tr = np.maximum.reduce([high - low, np.abs(high - prev_close), np.abs(low - prev_close)])
+        latest_atr = float(tr.mean())
+        current_price = float(df['close'].iloc[-1])
         
         if pd.isna(latest_atr) or current_price <= 0:
             return None
@@ -81,10 +67,28 @@ def calculate_position(etf_code):
         return None
 
 def main():
+    # 同一分钟内已计算过的ETF直接复用结果
+    bucket = minute_bucket()
+    positions = load_result_cache(RESULT_CACHE_FILE, bucket)
+    pending = [code for code in ETF_CODES if code not in positions]
+    if pending:
+        # 磁盘缓存只有已收盘的K线，当天K线来自实时行情；获取失败时只用已收盘的K线计算
+        try:
+            spot = fetch_etf_spot()
+        except Exception as e:
+            print(f"获取ETF实时行情失败: {e}")
+            spot = {}
+        # 并发预取历史数据；单只ETF的计算只需几毫秒，逐个串行计算
+        prefetch_etf_ohlcv(pending)
+        for etf_code in pending:
+            positions[etf_code] = calculate_position(etf_code, spot.get(etf_code))
+        # 失败的结果不缓存，下次运行重试
+        save_result_cache(RESULT_CACHE_FILE, bucket, {code: p for code, p in positions.items() if p})
+    
     results = []
     for etf_code in ETF_CODES:
         print(f"\n正在处理ETF {etf_code}...")
-        position = calculate_position(etf_code)
+        position = positions.get(etf_code)
         if position:
             print(f"最新价格: {position['最新价格']}")
             print(f"ATR值: {position['ATR值']}")
@@ -94,9 +98,11 @@ def main():
             results.append(position)
     
     if results:
-        # 保存结果到CSV
-        df = pd.DataFrame(results)
-        df.to_csv('etf_position_management.csv', index=False, encoding='utf_8_sig')
+        # 保存结果到CSV - 结果只有几行，直接写出不经过DataFrame
+        with open('etf_position_management.csv', 'w', newline='', encoding='utf_8_sig') as f:
+            writer = csv.DictWriter(f, fieldnames=results[0].keys())
+            writer.writeheader()
+            writer.writerows(results)
         print("\n仓位管理建议已保存到 etf_position_management.csv")
     else:
         print("没有有效的计算结果")
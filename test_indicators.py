@@ -0,0 +1,104 @@
+import warnings
+from collections import deque
+import numpy as np
+import pandas as pd
+import pytest
+from etf_indicators import IncrementalIndicators
+from etf_trend_signals import trend_signals_last
+
+ta_trend = pytest.importorskip('ta.trend')
+ta_momentum = pytest.importorskip('ta.momentum')
+
+# 回归测试 - 编译内核逐一复现了ta库的计算细节（ADX平滑序列的首项和末项、RSI的Wilder平滑等），
+# 这里直接与ta库和pandas ewm对比，防止修改内核时无意中改变计算口径
+
+
+def make_prices(seed, n, flat=False):
+    """生成n根3位小数的随机K线，返回float64行情值（high, low, close）；flat为True时高低收相同"""
+    rng = np.random.default_rng(seed)
+    close = np.round(3 + np.cumsum(rng.normal(0, 0.03, n)), 3).clip(0.5)
+    if flat:
+        return close, close, close
+    high = np.round(close + rng.uniform(0, 0.05, n), 3)
+    low = np.round(close - rng.uniform(0, 0.05, n), 3)
+    return high, low, close
+
+
+def reference_signals(high, low, close):
+    """用ta库和pandas计算最新的(ADX, DIF, DEA, RSI)，数据不足时ADX为NaN"""
+    c32 = pd.Series(close.astype(np.float32).astype(np.float64))  # 内核看到的收盘价
+    dif = c32.ewm(span=12, adjust=False).mean() - c32.ewm(span=26, adjust=False).mean()
+    dea = dif.ewm(span=9, adjust=False).mean()
+    rsi = ta_momentum.RSIIndicator(c32, window=14).rsi().iloc[-1]
+    adx = np.nan
+    if len(close) >= 2 * 14:  # 更短的数据ta会抛出IndexError
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            # ADX在原始float64行情值上计算，内核按最小变动单位还原价格后应与之一致
+            adx = ta_trend.ADXIndicator(pd.Series(high), pd.Series(low), pd.Series(close),
+                                        window=14).adx().iloc[-1]
+    return adx, dif.iloc[-1], dea.iloc[-1], rsi
+
+
+@pytest.mark.parametrize('seed', range(40))
+@pytest.mark.parametrize('n', [2, 13, 14, 27, 28, 29, 60, 400])
+@pytest.mark.parametrize('flat', [False, True])
+def test_trend_signals_last_matches_ta(seed, n, flat):
+    high, low, close = make_prices(seed, n, flat)
+    result = trend_signals_last(high.astype(np.float32), low.astype(np.float32), close.astype(np.float32),
+                                14, 12, 26, 9, 14)
+    np.testing.assert_allclose(result, reference_signals(high, low, close), rtol=1e-10, atol=1e-12)
+
+
+def test_trend_signals_last_constant_prices():
+    price = np.full(60, 3.0, dtype=np.float32)
+    adx, dif, dea, rsi = trend_signals_last(price, price, price, 14, 12, 26, 9, 14)
+    assert (adx, dif, dea, rsi) == (0.0, 0.0, 0.0, 100.0)
+
+
+def state_fields(state):
+    """把增量指标状态转成可以直接比较的字典"""
+    return {k: list(v) if isinstance(v, deque) else v for k, v in vars(state).items()}
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('n', [1, 2, 5, 15, 30, 300])
+def test_from_history_matches_extend(seed, n):
+    _, _, close = make_prices(seed, n)
+    close = close.astype(np.float32)
+    volume = np.random.default_rng(seed).integers(1_000_000, 500_000_000, n).astype(np.float64)
+    dates = pd.bdate_range('2024-01-02', periods=n)
+
+    seeded = IncrementalIndicators.from_history(close, volume, dates)
+    stepped = IncrementalIndicators().extend(close, volume, dates)
+    np.testing.assert_equal(state_fields(seeded), state_fields(stepped))
+
+    # 先用一部分历史初始化，再增量补齐，结果应与一次性初始化相同
+    split = n // 2
+    resumed = IncrementalIndicators.from_history(close[:split], volume[:split], dates[:split]) if split else \
+        IncrementalIndicators()
+    resumed.extend(close[split:], volume[split:], dates[split:])
+    np.testing.assert_equal(state_fields(resumed), state_fields(seeded))
+
+
+def float64_signals(high, low, close):
+    """全部在float64行情值上用ta库和pandas计算最新的(ADX, DIF, DEA, RSI)"""
+    c = pd.Series(close)
+    dif = c.ewm(span=12, adjust=False).mean() - c.ewm(span=26, adjust=False).mean()
+    dea = dif.ewm(span=9, adjust=False).mean()
+    rsi = ta_momentum.RSIIndicator(c, window=14).rsi().iloc[-1]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        adx = ta_trend.ADXIndicator(pd.Series(high), pd.Series(low), c, window=14).adx().iloc[-1]
+    return adx, dif.iloc[-1], dea.iloc[-1], rsi
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_float32_prices_within_tolerance_of_float64(seed):
+    # 价格以float32存储后，包括ADX在内的各指标与float64计算的相对误差应在1e-4以内；
+    # DIF/DEA可能接近0，另设绝对误差下限
+    n = int(np.random.default_rng(seed).integers(30, 800))
+    high, low, close = make_prices(seed, n)
+    result = trend_signals_last(high.astype(np.float32), low.astype(np.float32), close.astype(np.float32),
+                                14, 12, 26, 9, 14)
+    np.testing.assert_allclose(result, float64_signals(high, low, close), rtol=1e-4, atol=1e-6)